@@ -1,373 +1,508 @@
-# © 2023 Copyright SES AI
-# Author: Daniel Cogswell
-# Email: danielcogswell@ses.ai
-
-import os
-import mmap
-import struct
-import logging
-from datetime import datetime, timezone
-import pandas as pd
-
-from NewareNDA.dicts import rec_columns, aux_columns, dtype_dict, \
-    multiplier_dict, state_dict
-from .NewareNDAx import read_ndax
-
-
-def read(file, software_cycle_number=True, cycle_mode='chg'):
-    """
-    Read electrochemical data from an Neware nda or ndax binary file.
-
-    Args:
-        file (str): Name of an .nda or .ndax file to read
-        software_cycle_number (bool): Regenerate the cycle number to match
-            Neware's "Charge First" circular statistic setting
-        cycle_mode (str): Selects how the cycle is incremented.
-            'chg': (Default) Sets new cycles with a Charge step following a Discharge.
-            'dchg': Sets new cycles with a Discharge step following a Charge.
-            'auto': Identifies the first non-rest state as the incremental state.
-    Returns:
-        df (pd.DataFrame): DataFrame containing all records in the file
-    """
-    _, ext = os.path.splitext(file)
-    if ext == '.nda':
-        return read_nda(file, software_cycle_number, cycle_mode)
-    elif ext == '.ndax':
-        return read_ndax(file, software_cycle_number, cycle_mode)
-    else:
-        raise TypeError("File type not supported!")
-
-
-def read_nda(file, software_cycle_number, cycle_mode='chg'):
-    """
-    Function read electrochemical data from a Neware nda binary file.
-
-    Args:
-        file (str): Name of a .nda file to read
-        software_cycle_number (bool): Generate the cycle number field
-            to match old versions of BTSDA
-        cycle_mode (str): Selects how the cycle is incremented.
-            'chg': (Default) Sets new cycles with a Charge step following a Discharge.
-            'dchg': Sets new cycles with a Discharge step following a Charge.
-            'auto': Identifies the first non-rest state as the incremental state.
-    Returns:
-        df (pd.DataFrame): DataFrame containing all records in the file
-    """
-    with open(file, "rb") as f:
-        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
-
-        if mm.read(6) != b'NEWARE':
-            raise ValueError(f"{file} does not appear to be a Neware file.")
-
-        # Get the file version
-        [nda_version] = struct.unpack('<B', mm[14:15])
-        logging.info(f"NDA version: {nda_version}")
-
-        # Try to find server and client version info
-        version_loc = mm.find(b'BTSServer')
-        if version_loc != -1:
-            mm.seek(version_loc)
-            server = mm.read(50).strip(b'\x00').decode()
-            logging.info(f"Server: {server}")
-            mm.seek(50, 1)
-            client = mm.read(50).strip(b'\x00').decode()
-            logging.info(f"Client: {client}")
-        else:
-            logging.info("BTS version not found!")
-
-        # version specific settings
-        if nda_version == 29:
-            output, aux = _read_nda_29(mm)
-        elif nda_version == 130:
-            output, aux = _read_nda_130(mm)
-        else:
-            logging.error(f"nda version {nda_version} is not yet supported!")
-            raise NotImplementedError(f"nda version {nda_version} is not yet supported!")
-
-    # Create DataFrame and sort by Index
-    df = pd.DataFrame(output, columns=rec_columns)
-    df.drop_duplicates(subset='Index', inplace=True)
-
-    if not df['Index'].is_monotonic_increasing:
-        df.sort_values('Index', inplace=True)
-
-    df.reset_index(drop=True, inplace=True)
-
-    # Join temperature data
-    aux_df = pd.DataFrame(aux, columns=aux_columns)
-    aux_df.drop_duplicates(inplace=True)
-    if not aux_df.empty:
-        pvt_df = aux_df.pivot(index='Index', columns='Aux')
-        pvt_df.columns = pvt_df.columns.map(lambda x: ''.join(map(str, x)))
-        df = df.join(pvt_df, on='Index')
-
-    # Postprocessing
-    df['Step'] = _count_changes(df['Step'])
-    if software_cycle_number:
-        df['Cycle'] = _generate_cycle_number(df, cycle_mode)
-    df = df.astype(dtype=dtype_dict)
-
-    return df
-
-
-def _read_nda_29(mm):
-    """Helper function for nda version 29"""
-    mm_size = mm.size()
-
-    # Get the active mass
-    [active_mass] = struct.unpack('<I', mm[152:156])
-    logging.info(f"Active mass: {active_mass/1000} mg")
-
-    try:
-        remarks = mm[2317:2417].decode('ASCII')
-        # Clean null characters
-        remarks = remarks.replace(chr(0), '').strip()
-        logging.info(f"Remarks: {remarks}")
-    except UnicodeDecodeError:
-        logging.warning(f"Converting remark bytes into ASCII failed")
-        remarks = ""
-
-    # Identify the beginning of the data section
-    record_len = 86
-    identifier = b'\x00\x00\x00\x00\x55\x00'
-    header = mm.find(identifier)
-    if header == -1:
-        raise EOFError("File does not contain any valid records.")
-    while (((mm[header + 4 + record_len] != 85)
-            | (not _valid_record(mm[header+4:header+4+record_len])))
-            if header + 4 + record_len < mm_size
-            else False):
-        header = mm.find(identifier, header + 4)
-    mm.seek(header + 4)
-
-    # Read data records
-    output = []
-    aux = []
-    while mm.tell() < mm_size:
-        bytes = mm.read(record_len)
-        if len(bytes) == record_len:
-
-            # Check for a data record
-            if (bytes[0:2] == b'\x55\x00'
-                    and bytes[82:87] == b'\x00\x00\x00\x00'):
-                output.append(_bytes_to_list(bytes))
-
-            # Check for an auxiliary record
-            elif (bytes[0:1] == b'\x65'
-                    and bytes[82:87] == b'\x00\x00\x00\x00'):
-                aux.append(_aux_bytes_to_list(bytes))
-
-    return output, aux
-
-
-def _read_nda_130(mm):
-    """Helper function for nda version 130"""
-    mm_size = mm.size()
-
-    # Identify the beginning of the data section
-    record_len = 88
-    identifier = mm[1024:1030]
-    mm.seek(1024)
-
-    # Read data records
-    output = []
-    aux = []
-    while mm.tell() < mm_size:
-        bytes = mm.read(record_len)
-        if len(bytes) == record_len:
-
-            # Check for a data record
-            if bytes[0:6] == identifier:
-                output.append(_bytes_to_list_BTS9(bytes[4:]))
-
-            # Check for an auxiliary record
-            elif bytes[0:5] == b'\x00\x00\x00\x00\x65':
-                aux.append(_aux_bytes_to_list(bytes[4:]))
-
-    # Find footer data block
-    footer = mm.rfind(b'\x06\x00\xf0\x1d\x81\x00\x03\x00\x61\x90\x71\x90\x02\x7f\xff\x00', 1024)
-    if footer != -1:
-        mm.seek(footer+16)
-        bytes = mm.read(499)
-
-        # Get the active mass
-        [active_mass] = struct.unpack('<d', bytes[-8:])
-        logging.info(f"Active mass: {active_mass} mg")
-
-        # Get the remarks
-        remarks = bytes[363:491].decode('ASCII')
-
-        # Clean null characters
-        remarks = remarks.replace(chr(0), '').strip()
-        logging.info(f"Remarks: {remarks}")
-
-    return output, aux
-
-
-def _valid_record(bytes):
-    """Helper function to identify a valid record"""
-    # Check for a non-zero Status
-    [Status] = struct.unpack('<B', bytes[12:13])
-    return (Status != 0)
-
-
-def _bytes_to_list(bytes):
-    """Helper function for interpreting a byte string"""
-
-    # Extract fields from byte string
-    [Index, Cycle] = struct.unpack('<II', bytes[2:10])
-    [Step] = struct.unpack('<I', bytes[10:14])
-    [Status, Jump, Time] = struct.unpack('<BBQ', bytes[12:22])
-    [Voltage, Current] = struct.unpack('<ii', bytes[22:30])
-    [Charge_capacity, Discharge_capacity] = struct.unpack('<qq', bytes[38:54])
-    [Charge_energy, Discharge_energy] = struct.unpack('<qq', bytes[54:70])
-    [Y, M, D, h, m, s] = struct.unpack('<HBBBBB', bytes[70:77])
-    [Range] = struct.unpack('<i', bytes[78:82])
-
-    # Index and should not be zero
-    if Index == 0 or Status == 0:
-        return []
-
-    multiplier = multiplier_dict[Range]
-
-    # Create a dictionary for the record
-    list = [
-        Index,
-        Cycle + 1,
-        Step,
-        state_dict[Status],
-        Time/1000,
-        Voltage/10000,
-        Current*multiplier,
-        Charge_capacity*multiplier/3600,
-        Discharge_capacity*multiplier/3600,
-        Charge_energy*multiplier/3600,
-        Discharge_energy*multiplier/3600,
-        datetime(Y, M, D, h, m, s)
-    ]
-    return list
-
-
-def _bytes_to_list_BTS9(bytes):
-    """Helper function to interpret byte strings from BTS9"""
-    [Step, Status] = struct.unpack('<BB', bytes[5:7])
-    [Index] = struct.unpack('<I', bytes[12:16])
-    [Time] = struct.unpack('<Q', bytes[24:32])
-    [Voltage, Current] = struct.unpack('<ff', bytes[32:40])
-    [Charge_Capacity, Charge_Energy] = struct.unpack('<ff', bytes[48:56])
-    [Discharge_Capacity, Discharge_Energy] = struct.unpack('<ff', bytes[56:64])
-    [Date] = struct.unpack('<Q', bytes[64:72])
-
-    # Create a dictionary for the record
-    list = [
-        Index,
-        0,
-        Step,
-        state_dict[Status],
-        Time/1e6,
-        Voltage,
-        Current,
-        Charge_Capacity/3600,
-        Discharge_Capacity/3600,
-        Charge_Energy/3600,
-        Discharge_Energy/3600,
-        datetime.fromtimestamp(Date/1e6, timezone.utc).astimezone()
-    ]
-    return list
-
-
-def _aux_bytes_to_list(bytes):
-    """Helper function for intepreting auxiliary records"""
-    [Aux, Index] = struct.unpack('<BI', bytes[1:6])
-    [V] = struct.unpack('<i', bytes[22:26])
-    [T] = struct.unpack('<h', bytes[34:36])
-
-    return [Index, Aux, T/10, V/10000]
-
-
-def _generate_cycle_number(df, cycle_mode='chg'):
-    """
-    Generate a cycle number to match Neware.
-
-    cycle_mode = chg: (Default) Sets new cycles with a Charge step following a Discharge.
-        dchg: Sets new cycles with a Discharge step following a Charge.
-        auto: Identifies the first non-rest state as the incremental state.
-    """
-
-    # Auto: find the first non rest cycle
-    if cycle_mode.lower() == 'auto':
-        cycle_mode = _id_first_state(df)
-
-    # Set increment key and non-increment/off key
-    if cycle_mode.lower() == 'chg':
-        inkey = 'Chg'
-        offkey = 'DChg'
-    elif cycle_mode.lower() == 'dchg':
-        inkey = 'DChg'
-        offkey = 'Chg'
-    else:
-        raise KeyError(f"Cycle_Mode '{cycle_mode}' not recognized. Supported options are 'chg', 'dchg', and 'auto'.")
-
-    # Identify the beginning of key incremental steps
-    inc = (df['Status'] == 'CCCV_'+inkey) | (df['Status'] == 'CC_'+inkey) |  (df['Status'] == 'CP_'+inkey)
-
-    # inc series = 1 at new incremental step, 0 otherwise
-    inc = (inc - inc.shift()).clip(0)
-    inc.iat[0] = 1
-
-    # Convert to numpy arrays
-    inc = inc.values
-    status = df['Status'].values
-
-    # Increment the cycle at a charge step after there has been a discharge, or vice versa
-    cyc = 1
-    Flag = False
-    for n in range(len(inc)):
-        # Get Chg/DChg status
-        try:
-            method, state = status[n].split('_', 1)
-        except ValueError:
-            # Status is SIM or otherwise. Set Flag
-            Flag = True if status[n] == 'SIM' else Flag
-
-        else:
-            # Standard status type
-            if inc[n] & Flag:
-                # Increment the cycle number and reset flag when flag is active and the incremental step changes
-                cyc += 1
-                Flag = False
-            elif state == offkey:
-                Flag = True
-
-        finally:
-            inc[n] = cyc
-
-    return inc
-
-
-def _count_changes(series):
-    """Enumerate the number of value changes in a series"""
-    a = series.diff()
-    a.iloc[0] = 1
-    a.iloc[-1] = 0
-    return (abs(a) > 0).cumsum()
-
-
-def _id_first_state(df):
-    """Helper function to identify the first non-rest state in a cycling profile"""
-    nonrest_states = df[df['Status'] != 'Rest']['Status']
-
-    # If no non-rest cycles exist, just pick a mode; it doesn't matter.
-    if len(nonrest_states) > 0:
-        first_state = nonrest_states.iat[0]
-    else:
-        return 'chg'
-
-    try:
-        _, cycle_mode = first_state.split('_', 1)
-    except ValueError:
-        # Status is SIM or otherwise. Set mode to chg
-        logging.warning("First Step not recognized. Defaulting to Cycle_Mode 'Charge'.")
-        cycle_mode = 'chg'
-
-    return cycle_mode.lower()
+# © 2023 Copyright SES AI
+# Author: Daniel Cogswell
+# Email: danielcogswell@ses.ai
+
+import os
+import mmap
+import struct
+import logging
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+from NewareNDA.dicts import dtype_dict, multiplier_dict, state_dict
+from .NewareNDAx import read_ndax
+
+# Pre-compiled Struct objects shared by the record parsers. Reusing these
+# avoids re-parsing the format string on every unpack call.
+_struct_B = struct.Struct('<B')
+_struct_BB = struct.Struct('<BB')
+_struct_BBQ = struct.Struct('<BBQ')
+_struct_BI = struct.Struct('<BI')
+_struct_h = struct.Struct('<h')
+_struct_i = struct.Struct('<i')
+_struct_ii = struct.Struct('<ii')
+_struct_I = struct.Struct('<I')
+_struct_II = struct.Struct('<II')
+_struct_Q = struct.Struct('<Q')
+_struct_qq = struct.Struct('<qq')
+_struct_ff = struct.Struct('<ff')
+_struct_d = struct.Struct('<d')
+_struct_date = struct.Struct('<HBBBBB')
+
+# Categorical dtype and code lookup table derived from state_dict
+_state_dtype = pd.CategoricalDtype(sorted(state_dict.values()))
+_state_codes = np.full(256, -1, dtype=np.int8)
+for _code, _state in state_dict.items():
+    _state_codes[_code] = _state_dtype.categories.get_loc(_state)
+
+
+def _state_categorical(status):
+    """Map an array of raw Status codes directly to a categorical column"""
+    codes = _state_codes[status]
+    if (codes < 0).any():
+        raise KeyError(np.asarray(status)[codes < 0][0])
+    return pd.Categorical.from_codes(
+        codes, dtype=_state_dtype).remove_unused_categories()
+
+
+def read(file, software_cycle_number=True, cycle_mode='chg'):
+    """
+    Read electrochemical data from an Neware nda or ndax binary file.
+
+    Args:
+        file (str): Name of an .nda or .ndax file to read
+        software_cycle_number (bool): Regenerate the cycle number to match
+            Neware's "Charge First" circular statistic setting
+        cycle_mode (str): Selects how the cycle is incremented.
+            'chg': (Default) Sets new cycles with a Charge step following a Discharge.
+            'dchg': Sets new cycles with a Discharge step following a Charge.
+            'auto': Identifies the first non-rest state as the incremental state.
+    Returns:
+        df (pd.DataFrame): DataFrame containing all records in the file
+    """
+    _, ext = os.path.splitext(file)
+    if ext == '.nda':
+        return read_nda(file, software_cycle_number, cycle_mode)
+    elif ext == '.ndax':
+        return read_ndax(file, software_cycle_number, cycle_mode)
+    else:
+        raise TypeError("File type not supported!")
+
+
+def read_nda(file, software_cycle_number, cycle_mode='chg'):
+    """
+    Function read electrochemical data from a Neware nda binary file.
+
+    Args:
+        file (str): Name of a .nda file to read
+        software_cycle_number (bool): Generate the cycle number field
+            to match old versions of BTSDA
+        cycle_mode (str): Selects how the cycle is incremented.
+            'chg': (Default) Sets new cycles with a Charge step following a Discharge.
+            'dchg': Sets new cycles with a Discharge step following a Charge.
+            'auto': Identifies the first non-rest state as the incremental state.
+    Returns:
+        df (pd.DataFrame): DataFrame containing all records in the file
+    """
+    with open(file, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if mm.read(6) != b'NEWARE':
+            raise ValueError(f"{file} does not appear to be a Neware file.")
+
+        # Get the file version
+        [nda_version] = _struct_B.unpack_from(mm, 14)
+        logging.info(f"NDA version: {nda_version}")
+
+        # Try to find server and client version info
+        version_loc = mm.find(b'BTSServer')
+        if version_loc != -1:
+            mm.seek(version_loc)
+            server = mm.read(50).strip(b'\x00').decode()
+            logging.info(f"Server: {server}")
+            mm.seek(50, 1)
+            client = mm.read(50).strip(b'\x00').decode()
+            logging.info(f"Client: {client}")
+        else:
+            logging.info("BTS version not found!")
+
+        # version specific settings
+        if nda_version == 29:
+            df, aux_df = _read_nda_29(mm)
+        elif nda_version == 130:
+            df, aux_df = _read_nda_130(mm)
+        else:
+            logging.error(f"nda version {nda_version} is not yet supported!")
+            raise NotImplementedError(f"nda version {nda_version} is not yet supported!")
+
+    # Deduplicate and sort by Index in a single pass. A strictly
+    # increasing Index (the common case) needs neither.
+    idx = df['Index'].to_numpy()
+    if len(idx) and not np.all(idx[1:] > idx[:-1]):
+        order = np.argsort(idx, kind='stable')
+        idx = idx[order]
+        keep = np.concatenate(([True], idx[1:] != idx[:-1]))
+        df = df.take(order[keep])
+
+    df.reset_index(drop=True, inplace=True)
+
+    # Join temperature data
+    aux_df.drop_duplicates(inplace=True)
+    if not aux_df.empty:
+        pvt_df = aux_df.pivot(index='Index', columns='Aux')
+        pvt_df.columns = pvt_df.columns.map(lambda x: ''.join(map(str, x)))
+        df = df.join(pvt_df, on='Index')
+
+    # Postprocessing
+    df['Step'] = _count_changes(df['Step'])
+    if software_cycle_number:
+        df['Cycle'] = _generate_cycle_number(df, cycle_mode)
+    df = df.astype(dtype=dtype_dict, copy=False)
+
+    return df
+
+
+def _read_nda_29(mm):
+    """Helper function for nda version 29"""
+    mm_size = mm.size()
+
+    # Get the active mass
+    [active_mass] = _struct_I.unpack_from(mm, 152)
+    logging.info(f"Active mass: {active_mass/1000} mg")
+
+    try:
+        remarks = mm[2317:2417].decode('ASCII')
+        # Clean null characters
+        remarks = remarks.replace(chr(0), '').strip()
+        logging.info(f"Remarks: {remarks}")
+    except UnicodeDecodeError:
+        logging.warning(f"Converting remark bytes into ASCII failed")
+        remarks = ""
+
+    # Identify the beginning of the data section
+    record_len = 86
+    identifier = b'\x00\x00\x00\x00\x55\x00'
+    header = mm.find(identifier)
+    if header == -1:
+        raise EOFError("File does not contain any valid records.")
+    while (((mm[header + 4 + record_len] != 85)
+            | (not _valid_record(mm[header+4:header+4+record_len])))
+            if header + 4 + record_len < mm_size
+            else False):
+        header = mm.find(identifier, header + 4)
+
+    # Gather all records and classify them by their first bytes
+    start = header + 4
+    n_rec = (mm_size - start) // record_len
+    recs = np.frombuffer(mm, dtype=np.uint8, count=n_rec*record_len,
+                         offset=start).reshape(-1, record_len)
+    tail_ok = ~recs[:, 82:86].any(axis=1)
+
+    # Check for data and auxiliary records
+    data_mask = (recs[:, 0] == 0x55) & (recs[:, 1] == 0) & tail_ok
+    aux_mask = (recs[:, 0] == 0x65) & tail_ok
+
+    return _nda_records_to_df(recs[data_mask]), _nda_aux_to_df(recs[aux_mask])
+
+
+def _read_nda_130(mm):
+    """Helper function for nda version 130"""
+    mm_size = mm.size()
+
+    # Identify the beginning of the data section
+    record_len = 88
+    identifier = mm[1024:1030]
+
+    # Gather all records and classify them by their first bytes
+    n_rec = (mm_size - 1024) // record_len
+    recs = np.frombuffer(mm, dtype=np.uint8, count=n_rec*record_len,
+                         offset=1024).reshape(-1, record_len)
+
+    # Check for data and auxiliary records
+    data_mask = (recs[:, :6] ==
+                 np.frombuffer(identifier, dtype=np.uint8)).all(axis=1)
+    aux_mask = (recs[:, :5] ==
+                np.array([0, 0, 0, 0, 0x65], dtype=np.uint8)).all(axis=1)
+
+    df = _bts9_records_to_df(recs[data_mask])
+    aux_df = _nda_aux_to_df(recs[aux_mask][:, 4:])
+
+    # Find footer data block
+    footer = mm.rfind(b'\x06\x00\xf0\x1d\x81\x00\x03\x00\x61\x90\x71\x90\x02\x7f\xff\x00', 1024)
+    if footer != -1:
+        mm.seek(footer+16)
+        bytes = mm.read(499)
+
+        # Get the active mass
+        [active_mass] = _struct_d.unpack_from(bytes, len(bytes) - 8)
+        logging.info(f"Active mass: {active_mass} mg")
+
+        # Get the remarks
+        remarks = bytes[363:491].decode('ASCII')
+
+        # Clean null characters
+        remarks = remarks.replace(chr(0), '').strip()
+        logging.info(f"Remarks: {remarks}")
+
+    return df, aux_df
+
+
+# Field layout of an nda version 29 data record
+_nda_rec_dtype = np.dtype({
+    'names': [
+        'Index', 'Cycle', 'Step', 'Status', 'Time', 'Voltage', 'Current',
+        'Charge_Capacity', 'Discharge_Capacity',
+        'Charge_Energy', 'Discharge_Energy',
+        'Y', 'M', 'D', 'h', 'm', 's', 'Range'],
+    'formats': [
+        '<u4', '<u4', '<u4', 'u1', '<u8', '<i4', '<i4',
+        '<i8', '<i8', '<i8', '<i8',
+        '<u2', 'u1', 'u1', 'u1', 'u1', 'u1', '<i4'],
+    'offsets': [2, 6, 10, 12, 14, 22, 26, 38, 46, 54, 62,
+                70, 72, 73, 74, 75, 76, 78],
+    'itemsize': 82})
+
+# Field layout of a BTS9 (nda version 130) data record
+_bts9_rec_dtype = np.dtype({
+    'names': [
+        'Step', 'Status', 'Index', 'Time', 'Voltage', 'Current',
+        'Charge_Capacity', 'Charge_Energy',
+        'Discharge_Capacity', 'Discharge_Energy', 'Date'],
+    'formats': [
+        'u1', 'u1', '<u4', '<u8', '<f4', '<f4',
+        '<f4', '<f4', '<f4', '<f4', '<u8'],
+    'offsets': [9, 10, 16, 28, 36, 40, 52, 56, 60, 64, 68],
+    'itemsize': 76})
+
+# Field layout of an nda auxiliary record
+_nda_aux_dtype = np.dtype({
+    'names': ['Aux', 'Index', 'V', 'T'],
+    'formats': ['u1', '<u4', '<i4', '<i2'],
+    'offsets': [1, 2, 22, 34],
+    'itemsize': 36})
+
+
+def _nda_records_to_df(recs):
+    """
+    Helper function that converts a block of nda version 29 data records
+    into a DataFrame. recs is a 2D uint8 array with one record per row.
+    """
+    rec = np.ascontiguousarray(
+        recs[:, :_nda_rec_dtype.itemsize]).view(_nda_rec_dtype).ravel()
+
+    # Index and Status should not be zero
+    rec = rec[(rec['Index'] != 0) & (rec['Status'] != 0)]
+
+    # Look up the current multiplier for each record
+    ranges, inverse = np.unique(rec['Range'], return_inverse=True)
+    multiplier = np.array([multiplier_dict[r] for r in ranges])[inverse]
+
+    # Fold the 1/3600 capacity scaling into the multiplier so each column
+    # needs only a single multiply
+    cap_multiplier = multiplier*(1/3600)
+
+    df = pd.DataFrame({
+        'Index': rec['Index'],
+        'Cycle': (rec['Cycle'] + 1).astype('uint16'),
+        'Step': rec['Step'],
+        'Status': _state_categorical(rec['Status']),
+        'Time': (rec['Time']*1e-3).astype('float32'),
+        'Voltage': (rec['Voltage']*1e-4).astype('float32'),
+        'Current(mA)': (rec['Current']*multiplier).astype('float32'),
+        'Charge_Capacity(mAh)': (rec['Charge_Capacity']*cap_multiplier).astype('float32'),
+        'Discharge_Capacity(mAh)': (rec['Discharge_Capacity']*cap_multiplier).astype('float32'),
+        'Charge_Energy(mWh)': (rec['Charge_Energy']*cap_multiplier).astype('float32'),
+        'Discharge_Energy(mWh)': (rec['Discharge_Energy']*cap_multiplier).astype('float32'),
+        'Timestamp': pd.to_datetime(dict(
+            year=rec['Y'], month=rec['M'], day=rec['D'],
+            hour=rec['h'], minute=rec['m'], second=rec['s']))})
+    return df
+
+
+def _bts9_records_to_df(recs):
+    """
+    Helper function that converts a block of BTS9 data records into a
+    DataFrame. recs is a 2D uint8 array with one record per row.
+    """
+    rec = np.ascontiguousarray(
+        recs[:, :_bts9_rec_dtype.itemsize]).view(_bts9_rec_dtype).ravel()
+
+    df = pd.DataFrame({
+        'Index': rec['Index'],
+        'Cycle': np.zeros(len(rec), dtype='uint16'),
+        'Step': rec['Step'],
+        'Status': _state_categorical(rec['Status']),
+        'Time': (rec['Time']*1e-6).astype('float32'),
+        'Voltage': rec['Voltage'],
+        'Current(mA)': rec['Current'],
+        'Charge_Capacity(mAh)': (rec['Charge_Capacity'].astype('float64')*(1/3600)).astype('float32'),
+        'Discharge_Capacity(mAh)': (rec['Discharge_Capacity'].astype('float64')*(1/3600)).astype('float32'),
+        'Charge_Energy(mWh)': (rec['Charge_Energy'].astype('float64')*(1/3600)).astype('float32'),
+        'Discharge_Energy(mWh)': (rec['Discharge_Energy'].astype('float64')*(1/3600)).astype('float32'),
+        'Timestamp': pd.to_datetime(rec['Date'], unit='us', utc=True)
+        .tz_convert(datetime.now(timezone.utc).astimezone().tzinfo)})
+    return df
+
+
+def _nda_aux_to_df(recs):
+    """
+    Helper function that converts a block of nda auxiliary records into a
+    DataFrame. recs is a 2D uint8 array with one record per row.
+    """
+    rec = np.ascontiguousarray(
+        recs[:, :_nda_aux_dtype.itemsize]).view(_nda_aux_dtype).ravel()
+    return pd.DataFrame({
+        'Index': rec['Index'],
+        'Aux': rec['Aux'],
+        'T': rec['T']*0.1,
+        'V': rec['V']*1e-4})
+
+
+def _valid_record(bytes):
+    """Helper function to identify a valid record"""
+    # Check for a non-zero Status
+    [Status] = _struct_B.unpack_from(bytes, 12)
+    return (Status != 0)
+
+
+def _bytes_to_list(bytes):
+    """Helper function for interpreting a byte string"""
+
+    # Extract fields from byte string
+    [Index, Cycle] = _struct_II.unpack_from(bytes, 2)
+    [Step] = _struct_I.unpack_from(bytes, 10)
+    [Status, Jump, Time] = _struct_BBQ.unpack_from(bytes, 12)
+    [Voltage, Current] = _struct_ii.unpack_from(bytes, 22)
+    [Charge_capacity, Discharge_capacity] = _struct_qq.unpack_from(bytes, 38)
+    [Charge_energy, Discharge_energy] = _struct_qq.unpack_from(bytes, 54)
+    [Y, M, D, h, m, s] = _struct_date.unpack_from(bytes, 70)
+    [Range] = _struct_i.unpack_from(bytes, 78)
+
+    # Index and should not be zero
+    if Index == 0 or Status == 0:
+        return []
+
+    multiplier = multiplier_dict[Range]
+
+    # Create a dictionary for the record
+    list = [
+        Index,
+        Cycle + 1,
+        Step,
+        state_dict[Status],
+        Time/1000,
+        Voltage/10000,
+        Current*multiplier,
+        Charge_capacity*multiplier/3600,
+        Discharge_capacity*multiplier/3600,
+        Charge_energy*multiplier/3600,
+        Discharge_energy*multiplier/3600,
+        datetime(Y, M, D, h, m, s)
+    ]
+    return list
+
+
+def _bytes_to_list_BTS9(bytes):
+    """Helper function to interpret byte strings from BTS9"""
+    [Step, Status] = _struct_BB.unpack_from(bytes, 5)
+    [Index] = _struct_I.unpack_from(bytes, 12)
+    [Time] = _struct_Q.unpack_from(bytes, 24)
+    [Voltage, Current] = _struct_ff.unpack_from(bytes, 32)
+    [Charge_Capacity, Charge_Energy] = _struct_ff.unpack_from(bytes, 48)
+    [Discharge_Capacity, Discharge_Energy] = _struct_ff.unpack_from(bytes, 56)
+    [Date] = _struct_Q.unpack_from(bytes, 64)
+
+    # Create a dictionary for the record
+    list = [
+        Index,
+        0,
+        Step,
+        state_dict[Status],
+        Time/1e6,
+        Voltage,
+        Current,
+        Charge_Capacity/3600,
+        Discharge_Capacity/3600,
+        Charge_Energy/3600,
+        Discharge_Energy/3600,
+        datetime.fromtimestamp(Date/1e6, timezone.utc).astimezone()
+    ]
+    return list
+
+
+def _aux_bytes_to_list(bytes):
+    """Helper function for intepreting auxiliary records"""
+    [Aux, Index] = _struct_BI.unpack_from(bytes, 1)
+    [V] = _struct_i.unpack_from(bytes, 22)
+    [T] = _struct_h.unpack_from(bytes, 34)
+
+    return [Index, Aux, T/10, V/10000]
+
+
+def _generate_cycle_number(df, cycle_mode='chg'):
+    """
+    Generate a cycle number to match Neware.
+
+    cycle_mode = chg: (Default) Sets new cycles with a Charge step following a Discharge.
+        dchg: Sets new cycles with a Discharge step following a Charge.
+        auto: Identifies the first non-rest state as the incremental state.
+    """
+
+    # Auto: find the first non rest cycle
+    if cycle_mode.lower() == 'auto':
+        cycle_mode = _id_first_state(df)
+
+    # Set increment key and non-increment/off key
+    if cycle_mode.lower() == 'chg':
+        inkey = 'Chg'
+        offkey = 'DChg'
+    elif cycle_mode.lower() == 'dchg':
+        inkey = 'DChg'
+        offkey = 'Chg'
+    else:
+        raise KeyError(f"Cycle_Mode '{cycle_mode}' not recognized. Supported options are 'chg', 'dchg', and 'auto'.")
+
+    # Identify the beginning of key incremental steps
+    inc = (df['Status'] == 'CCCV_'+inkey) | (df['Status'] == 'CC_'+inkey) |  (df['Status'] == 'CP_'+inkey)
+
+    # inc series = 1 at new incremental step, 0 otherwise
+    inc = (inc - inc.shift()).clip(0)
+    inc.iat[0] = 1
+
+    # Convert to numpy arrays
+    inc = inc.values
+    status = df['Status'].values
+
+    # Increment the cycle at a charge step after there has been a discharge, or vice versa
+    cyc = 1
+    Flag = False
+    for n in range(len(inc)):
+        # Get Chg/DChg status
+        try:
+            method, state = status[n].split('_', 1)
+        except ValueError:
+            # Status is SIM or otherwise. Set Flag
+            Flag = True if status[n] == 'SIM' else Flag
+
+        else:
+            # Standard status type
+            if inc[n] & Flag:
+                # Increment the cycle number and reset flag when flag is active and the incremental step changes
+                cyc += 1
+                Flag = False
+            elif state == offkey:
+                Flag = True
+
+        finally:
+            inc[n] = cyc
+
+    return inc
+
+
+def _count_changes(series):
+    """Enumerate the number of value changes in a series"""
+    a = series.diff()
+    a.iloc[0] = 1
+    a.iloc[-1] = 0
+    return (abs(a) > 0).cumsum()
+
+
+def _id_first_state(df):
+    """Helper function to identify the first non-rest state in a cycling profile"""
+    nonrest_states = df[df['Status'] != 'Rest']['Status']
+
+    # If no non-rest cycles exist, just pick a mode; it doesn't matter.
+    if len(nonrest_states) > 0:
+        first_state = nonrest_states.iat[0]
+    else:
+        return 'chg'
+
+    try:
+        _, cycle_mode = first_state.split('_', 1)
+    except ValueError:
+        # Status is SIM or otherwise. Set mode to chg
+        logging.warning("First Step not recognized. Defaulting to Cycle_Mode 'Charge'.")
+        cycle_mode = 'chg'
+
+    return cycle_mode.lower()
@@ -1,431 +1,606 @@
-# © 2023 Copyright SES AI
-# Author: Daniel Cogswell
-# Email: danielcogswell@ses.ai
-
-import mmap
-import struct
-import logging
-import tempfile
-import zipfile
-import re
-from datetime import datetime, timezone
-import xml.etree.ElementTree as ET
-import pandas as pd
-
-import NewareNDA.NewareNDA
-from NewareNDA.dicts import rec_columns, dtype_dict, state_dict, \
-     multiplier_dict
-
-
-def read_ndax(file, software_cycle_number=False, cycle_mode='chg'):
-    """
-    Function to read electrochemical data from a Neware ndax binary file.
-
-    Args:
-        file (str): Name of an .ndax file to read
-        software_cycle_number (bool): Regenerate the cycle number field
-        cycle_mode (str): Selects how the cycle is incremented.
-            'chg': (Default) Sets new cycles with a Charge step following a Discharge.
-            'dchg': Sets new cycles with a Discharge step following a Charge.
-            'auto': Identifies the first non-rest state as the incremental state.
-    Returns:
-        df (pd.DataFrame): DataFrame containing all records in the file
-    """
-    with tempfile.TemporaryDirectory() as tmpdir:
-        zf = zipfile.PyZipFile(file)
-
-        # Read version information
-        try:
-            version_info = zf.extract('VersionInfo.xml', path=tmpdir)
-            with open(version_info, 'r', encoding='gb2312') as f:
-                config = ET.fromstring(f.read()).find('config/ZwjVersion')
-            logging.info(f"Server version: {config.attrib['SvrVer']}")
-            logging.info(f"Client version: {config.attrib['CurrClientVer']}")
-            logging.info(f"Control unit version: {config.attrib['ZwjVersion']}")
-            logging.info(f"Tester version: {config.attrib['MainXwjVer']}")
-        except Exception:
-            pass
-
-        # Read active mass
-        try:
-            step = zf.extract('Step.xml', path=tmpdir)
-            with open(step, 'r', encoding='gb2312') as f:
-                config = ET.fromstring(f.read()).find('config')
-            active_mass = float(config.find('Head_Info/SCQ').attrib['Value'])
-            logging.info(f"Active mass: {active_mass/1000} mg")
-        except Exception:
-            pass
-
-        data_file = zf.extract('data.ndc', path=tmpdir)
-
-        # Some ndax have data spread across 3 different ndc files. Others have
-        # all data in data.ndc.
-        # Check if data_runInfo.ndc and data_step.ndc exist
-        if all(i in zf.namelist() for i in ['data_runInfo.ndc', 'data_step.ndc']):
-
-            # Read data from separate files
-            runInfo_file = zf.extract('data_runInfo.ndc', path=tmpdir)
-            step_file = zf.extract('data_step.ndc', path=tmpdir)
-            data_df = _read_data_ndc(data_file)
-            runInfo_df = _read_data_runInfo_ndc(runInfo_file)
-            step_df = _read_data_step_ndc(step_file)
-
-            # Merge dataframes
-            data_df = data_df.merge(runInfo_df, how='left', on='Index')
-            data_df['Step'] = data_df['Step'].ffill()
-            data_df = data_df.merge(step_df, how='left', on='Step').reindex(
-                columns=rec_columns)
-
-            # Fill in missing data - Neware appears to fabricate data
-            _data_interpolation(data_df)
-
-        else:
-            data_df, _ = read_ndc(data_file)
-
-        # Read and merge Aux data from ndc files
-        aux_df = pd.DataFrame([])
-        for f in zf.namelist():
-            m = re.search(".*_([0-9]+)[.]ndc", f)
-            if m:
-                aux_file = zf.extract(f, path=tmpdir)
-                _, aux = read_ndc(aux_file)
-                aux['Aux'] = int(m[1])
-                aux_df = pd.concat([aux_df, aux], ignore_index=True)
-        if not aux_df.empty:
-            pvt_df = aux_df.pivot(index='Index', columns='Aux')
-            pvt_df.columns = pvt_df.columns.map(lambda x: ''.join(map(str, x)))
-            data_df = data_df.join(pvt_df, on='Index')
-
-    if software_cycle_number:
-        data_df['Cycle'] = NewareNDA.NewareNDA._generate_cycle_number(data_df, cycle_mode)
-
-    return data_df.astype(dtype=dtype_dict)
-
-
-def _data_interpolation(df):
-    """
-    Some ndax from from BTS Server 8 do not seem to contain a complete dataset.
-    This helper function fills in missing times, capacities, and energies.
-    """
-    # Identify the valid data
-    nan_mask = df['Time'].notnull()
-
-    if nan_mask.any():
-        logging.warning("IMPORTANT: This ndax has missing data. The output "
-                        "from NewareNDA contains interpolated data!")
-
-    # Group by step and run 'inside' interpolation on Time
-    df['Time'] = df.groupby('Step')['Time'].transform(
-        lambda x: pd.Series.interpolate(x, limit_area='inside'))
-
-    # Perform extrapolation to generate the remaining missing Time
-    nan_mask2 = df['Time'].notnull()
-    time_inc = df['Time'].diff().ffill().groupby(nan_mask2.cumsum()).cumsum()
-    time = df['Time'].ffill() + time_inc.shift()
-    df['Time'] = df['Time'].where(nan_mask2, time)
-
-    # Fill in missing Timestamps
-    time_inc = df['Time'].diff().groupby(nan_mask.cumsum()).cumsum()
-    timestamp = df['Timestamp'].ffill() + \
-        pd.to_timedelta(time_inc.shift().fillna(0), unit='s')
-    df['Timestamp'] = df['Timestamp'].where(nan_mask, timestamp)
-
-    # Integrate to get capacity and fill missing values
-    capacity = df['Time'].diff()*abs(df['Current(mA)'])/3600
-    inc = capacity.groupby(nan_mask.cumsum()).cumsum()
-    chg = df['Charge_Capacity(mAh)'].ffill() + \
-        inc.where(df['Current(mA)'] > 0, 0).shift()
-    dch = df['Discharge_Capacity(mAh)'].ffill() + \
-        inc.where(df['Current(mA)'] < 0, 0).shift()
-    df['Charge_Capacity(mAh)'] = df['Charge_Capacity(mAh)'].where(nan_mask, chg)
-    df['Discharge_Capacity(mAh)'] = df['Discharge_Capacity(mAh)'].where(nan_mask, dch)
-
-    # Integrate to get energy and fill missing values
-    energy = capacity*df['Voltage']
-    inc = energy.groupby(nan_mask.cumsum()).cumsum()
-    chg = df['Charge_Energy(mWh)'].ffill() + \
-        inc.where(df['Current(mA)'] > 0, 0).shift()
-    dch = df['Discharge_Energy(mWh)'].ffill() + \
-        inc.where(df['Current(mA)'] < 0, 0).shift()
-    df['Charge_Energy(mWh)'] = df['Charge_Energy(mWh)'].where(nan_mask, chg)
-    df['Discharge_Energy(mWh)'] = df['Discharge_Energy(mWh)'].where(nan_mask, dch)
-
-
-def _read_data_ndc(file):
-    with open(file, 'rb') as f:
-        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
-        mm_size = mm.size()
-
-        # Choose multipliers based on ndc file version
-        [ndc_version] = struct.unpack('<B', mm[2:3])
-        multipliers = [1e-4, 1]
-        if ndc_version == 14:
-            multipliers = [1, 1000]
-
-        # Identify the beginning of the data section
-        record_len = 4096
-        header = 4096
-
-        # Read data records
-        rec = []
-        mm.seek(header)
-        while mm.tell() < mm_size:
-            bytes = mm.read(record_len)
-            for i in struct.iter_unpack('<ff', bytes[132:-4]):
-                if (i[0] != 0):
-                    rec.append([i[0], i[1]])
-
-    # Create DataFrame
-    df = multipliers*pd.DataFrame(rec, columns=['Voltage', 'Current(mA)'])
-    df['Index'] = df.index + 1
-    return df
-
-
-def _read_data_runInfo_ndc(file):
-    with open(file, 'rb') as f:
-        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
-        mm_size = mm.size()
-
-        # Choose byte format based on ndc file version
-        [ndc_version] = struct.unpack('<B', mm[2:3])
-        format = '<isffff12siii2s'
-        multipliers = [1e-3, 1/3600, 1/3600, 1/3600, 1/3600]
-        end_byte = -63
-        if ndc_version >= 14:
-            format = '<isffff12siii10s'
-            end_byte = -59
-            multipliers = [1e-3, 1000, 1000, 1000, 1000]
-
-        # Identify the beginning of the data section
-        record_len = 4096
-        header = 4096
-
-        # Read data records
-        rec = []
-        mm.seek(header)
-        while mm.tell() < mm_size:
-            bytes = mm.read(record_len)
-            for i in struct.iter_unpack(format, bytes[132:end_byte]):
-                Time = i[0]
-                [Charge_Capacity, Discharge_Capacity] = [i[2], i[3]]
-                [Charge_Energy, Discharge_Energy] = [i[4], i[5]]
-                [Timestamp, Step, Index] = [i[7], i[8], i[9]]
-                if Index != 0:
-                    rec.append([Time,
-                                Charge_Capacity, Discharge_Capacity,
-                                Charge_Energy, Discharge_Energy,
-                                datetime.fromtimestamp(Timestamp, timezone.utc).astimezone(), Step, Index])
-
-    # Create DataFrame
-    df = pd.DataFrame(rec, columns=[
-        'Time',
-        'Charge_Capacity(mAh)', 'Discharge_Capacity(mAh)',
-        'Charge_Energy(mWh)', 'Discharge_Energy(mWh)',
-        'Timestamp', 'Step', 'Index']).astype({'Time': 'float'})
-    df.iloc[:, 0:5] *= multipliers
-    df['Step'] = NewareNDA.NewareNDA._count_changes(df['Step'])
-
-    return df
-
-
-def _read_data_step_ndc(file):
-    with open(file, 'rb') as f:
-        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
-        mm_size = mm.size()
-
-        # Identify the beginning of the data section
-        record_len = 4096
-        header = 4096
-
-        # Read data records
-        rec = []
-        mm.seek(header)
-        while mm.tell() < mm_size:
-            bytes = mm.read(record_len)
-            for i in struct.iter_unpack('<ii16sb12s', bytes[132:-5]):
-                [Cycle, Step_Index, Status] = [i[0], i[1], i[3]]
-                if Step_Index != 0:
-                    rec.append([Cycle+1, Step_Index, state_dict[Status]])
-
-    # Create DataFrame
-    df = pd.DataFrame(rec, columns=['Cycle', 'Step_Index', 'Status'])
-    df['Step'] = df.index + 1
-    return df
-
-
-def read_ndc(file):
-    """
-    Function to read electrochemical data from a Neware ndc binary file.
-
-    Args:
-        file (str): Name of an .ndc file to read
-    Returns:
-        df (pd.DataFrame): DataFrame containing all records in the file
-        aux_df (pd.DataFrame): DataFrame containing any temperature data
-    """
-    with open(file, 'rb') as f:
-        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
-
-        # Get ndc file version
-        [ndc_version] = struct.unpack('<B', mm[2:3])
-        logging.info(f"NDC version: {ndc_version}")
-
-        if ndc_version == 2:
-            return _read_ndc_2(mm)
-        if ndc_version == 5:
-            return _read_ndc_5(mm)
-        elif ndc_version == 11:
-            return _read_ndc_11(mm)
-        else:
-            raise NotImplementedError(f"ndc version {ndc_version} is not yet supported!")
-
-
-def _read_ndc_2(mm):
-    """Helper function that reads records and aux data from ndc version 2"""
-    record_len = 94
-    offset = 0
-    identifier = mm[517:525]
-    id_byte = slice(0, 1)
-    rec_byte = slice(0, 1)
-
-    # Read data records
-    output = []
-    aux = []
-    header = mm.find(identifier)
-    while header != -1:
-        mm.seek(header - offset)
-        bytes = mm.read(record_len)
-        if bytes[rec_byte] == b'\x55':
-            output.append(_bytes_to_list_ndc(bytes))
-        elif bytes[rec_byte] == b'\x65':
-            aux.append(_aux_bytes_65_to_list_ndc(bytes))
-        elif bytes[rec_byte] == b'\x74':
-            aux.append(_aux_bytes_74_to_list_ndc(bytes))
-        else:
-            logging.warning("Unknown record type: "+bytes[rec_byte].hex())
-
-        header = mm.find(identifier, header - offset + record_len)
-
-    # Create DataFrame and sort by Index
-    df = pd.DataFrame(output, columns=rec_columns)
-
-    # Postprocessing
-    aux_df = pd.DataFrame([])
-    df = df.astype(dtype=dtype_dict)
-    if identifier[id_byte] == b'\x65':
-        aux_df = pd.DataFrame(aux, columns=['Index', 'Aux', 'V', 'T'])
-    elif identifier[id_byte] == b'\x74':
-        aux_df = pd.DataFrame(aux, columns=['Index', 'Aux', 'V', 'T', 't'])
-
-    return df, aux_df
-
-
-def _read_ndc_5(mm):
-    """Helper function that reads records and aux data from ndc version 5"""
-    mm_size = mm.size()
-    record_len = 4096
-    header = 4096
-    rec_byte = slice(7, 8)
-
-    # Read data records
-    output = []
-    aux65 = []
-    aux74 = []
-    mm.seek(header)
-    while mm.tell() < mm_size:
-        bytes = mm.read(record_len)
-        for i in struct.iter_unpack('<87s', bytes[125:-56]):
-            if i[0][rec_byte] == b'\x55':
-                output.append(_bytes_to_list_ndc(i[0]))
-            if i[0][rec_byte] == b'\x65':
-                aux65.append(_aux_bytes_65_to_list_ndc(i[0]))
-            elif i[0][rec_byte] == b'\x74':
-                aux74.append(_aux_bytes_74_to_list_ndc(i[0]))
-
-    # Create DataFrames
-    df = pd.DataFrame(output, columns=rec_columns)
-
-    # Concat aux65 and aux74 if they both contain data
-    aux_df = pd.DataFrame(aux65, columns=['Index', 'Aux', 'V', 'T'])
-    aux74_df = pd.DataFrame(aux74, columns=['Index', 'Aux', 'V', 'T', 't'])
-    if (not aux_df.empty) & (not aux74_df.empty):
-        aux_df = pd.concat([aux_df, aux74_df.drop(columns=['t'])])
-    elif (not aux74_df.empty):
-        aux_df = aux74_df
-
-    return df, aux_df
-
-
-def _read_ndc_11(mm):
-    """Helper function that reads aux data from ndc version 11"""
-    mm_size = mm.size()
-    record_len = 4096
-    header = 4096
-
-    # Read data records
-    aux = []
-    mm.seek(header)
-    while mm.tell() < mm_size:
-        bytes = mm.read(record_len)
-        for i in struct.iter_unpack('<cfh', bytes[132:-2]):
-            if i[0] == b'\x65':
-                aux.append([i[1]/10000, i[2]/10])
-
-    # Create DataFrame
-    aux_df = pd.DataFrame(aux, columns=['V', 'T'])
-    aux_df['Index'] = aux_df.index + 1
-    return None, aux_df
-
-
-def _bytes_to_list_ndc(bytes):
-    """Helper function for interpreting an ndc byte string"""
-
-    # Extract fields from byte string
-    [Index, Cycle] = struct.unpack('<II', bytes[8:16])
-    [Step] = struct.unpack('<B', bytes[16:17])
-    [Status] = struct.unpack('<B', bytes[17:18])
-    [Time] = struct.unpack('<Q', bytes[23:31])
-    [Voltage, Current] = struct.unpack('<ii', bytes[31:39])
-    [Charge_capacity, Discharge_capacity] = struct.unpack('<qq', bytes[43:59])
-    [Charge_energy, Discharge_energy] = struct.unpack('<qq', bytes[59:75])
-    [Y, M, D, h, m, s] = struct.unpack('<HBBBBB', bytes[75:82])
-    [Range] = struct.unpack('<i', bytes[82:86])
-
-    multiplier = multiplier_dict[Range]
-
-    # Create a record
-    list = [
-        Index,
-        Cycle + 1,
-        Step,
-        state_dict[Status],
-        Time/1000,
-        Voltage/10000,
-        Current*multiplier,
-        Charge_capacity*multiplier/3600,
-        Discharge_capacity*multiplier/3600,
-        Charge_energy*multiplier/3600,
-        Discharge_energy*multiplier/3600,
-        datetime(Y, M, D, h, m, s)
-    ]
-    return list
-
-
-def _aux_bytes_65_to_list_ndc(bytes):
-    """Helper function for intepreting auxiliary records"""
-    [Aux] = struct.unpack('<B', bytes[3:4])
-    [Index] = struct.unpack('<I', bytes[8:12])
-    [T] = struct.unpack('<h', bytes[41:43])
-    [V] = struct.unpack('<i', bytes[31:35])
-
-    return [Index, Aux, V/10000, T/10]
-
-
-def _aux_bytes_74_to_list_ndc(bytes):
-    """Helper function for intepreting auxiliary records"""
-    [Aux] = struct.unpack('<B', bytes[3:4])
-    [Index] = struct.unpack('<I', bytes[8:12])
-    [V] = struct.unpack('<i', bytes[31:35])
-    [T, t] = struct.unpack('<hh', bytes[41:45])
-
-    return [Index, Aux, V/10000, T/10, t/10]
+# © 2023 Copyright SES AI
+# Author: Daniel Cogswell
+# Email: danielcogswell@ses.ai
+
+import mmap
+import struct
+import logging
+import zipfile
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import xml.etree.ElementTree as ET
+import numpy as np
+import pandas as pd
+
+import NewareNDA.NewareNDA
+from NewareNDA.dicts import rec_columns, dtype_dict, state_dict, \
+     multiplier_dict
+
+# Filename pattern of the auxiliary ndc files inside an ndax
+_aux_re = re.compile(r".*_([0-9]+)[.]ndc")
+
+# Pre-compiled Struct objects shared by the record parsers
+_struct_B = struct.Struct('<B')
+_struct_h = struct.Struct('<h')
+_struct_hh = struct.Struct('<hh')
+_struct_i = struct.Struct('<i')
+_struct_ii = struct.Struct('<ii')
+_struct_I = struct.Struct('<I')
+_struct_II = struct.Struct('<II')
+_struct_Q = struct.Struct('<Q')
+_struct_qq = struct.Struct('<qq')
+_struct_date = struct.Struct('<HBBBBB')
+
+
+def read_ndax(file, software_cycle_number=False, cycle_mode='chg'):
+    """
+    Function to read electrochemical data from a Neware ndax binary file.
+
+    Args:
+        file (str): Name of an .ndax file to read
+        software_cycle_number (bool): Regenerate the cycle number field
+        cycle_mode (str): Selects how the cycle is incremented.
+            'chg': (Default) Sets new cycles with a Charge step following a Discharge.
+            'dchg': Sets new cycles with a Discharge step following a Charge.
+            'auto': Identifies the first non-rest state as the incremental state.
+    Returns:
+        df (pd.DataFrame): DataFrame containing all records in the file
+    """
+    with zipfile.ZipFile(file, mode='r') as zf:
+
+        # Read version information
+        try:
+            config = ET.fromstring(
+                zf.read('VersionInfo.xml').decode('gb2312')).find(
+                'config/ZwjVersion')
+            logging.info(f"Server version: {config.attrib['SvrVer']}")
+            logging.info(f"Client version: {config.attrib['CurrClientVer']}")
+            logging.info(f"Control unit version: {config.attrib['ZwjVersion']}")
+            logging.info(f"Tester version: {config.attrib['MainXwjVer']}")
+        except Exception:
+            pass
+
+        # Read active mass
+        try:
+            config = ET.fromstring(
+                zf.read('Step.xml').decode('gb2312')).find('config')
+            active_mass = float(config.find('Head_Info/SCQ').attrib['Value'])
+            logging.info(f"Active mass: {active_mass/1000} mg")
+        except Exception:
+            pass
+
+        # Some ndax have data spread across 3 different ndc files. Others have
+        # all data in data.ndc.
+        # Check if data_runInfo.ndc and data_step.ndc exist
+        members = zf.namelist()
+        if all(i in members for i in ['data_runInfo.ndc', 'data_step.ndc']):
+
+            # Read data directly from the zip without extracting to disk
+            data_df = _read_data_ndc(zf.read('data.ndc'))
+            runInfo_df = _read_data_runInfo_ndc(zf.read('data_runInfo.ndc'))
+            step_df = _read_data_step_ndc(zf.read('data_step.ndc'))
+
+            # Merge dataframes. data.ndc carries a dense 1..N Index, so
+            # runInfo can be aligned on its Index directly instead of
+            # through a hash-based merge of both frames.
+            data_df = data_df.join(runInfo_df.set_index('Index'), on='Index')
+            data_df['Step'] = _ffill(data_df['Step'].to_numpy(dtype='float64'))
+            data_df = data_df.merge(step_df, how='left', on='Step').reindex(
+                columns=rec_columns)
+
+            # Fill in missing data - Neware appears to fabricate data
+            _data_interpolation(data_df)
+
+        else:
+            data_df, _ = read_ndc(zf.read('data.ndc'))
+
+        # Identify the Aux data ndc files
+        aux_members = []
+        for info in zf.infolist():
+            m = _aux_re.search(info.filename)
+            if m:
+                aux_members.append((info.filename, int(m[1])))
+
+        def _read_aux(member):
+            filename, aux_id = member
+            _, aux = read_ndc(zf.read(filename))
+            aux['Aux'] = aux_id
+            return aux
+
+        # Read and merge Aux data. The files are independent and the
+        # parsers run mostly in GIL-releasing numpy and zlib code, so
+        # they can be read concurrently.
+        if len(aux_members) > 1:
+            with ThreadPoolExecutor(
+                    max_workers=min(8, len(aux_members))) as ex:
+                aux_frames = list(ex.map(_read_aux, aux_members))
+        else:
+            aux_frames = [_read_aux(member) for member in aux_members]
+        aux_df = pd.concat(aux_frames, ignore_index=True) \
+            if aux_frames else pd.DataFrame([])
+        if not aux_df.empty:
+            pvt_df = aux_df.pivot(index='Index', columns='Aux')
+            pvt_df.columns = pvt_df.columns.map(lambda x: ''.join(map(str, x)))
+            data_df = data_df.join(pvt_df, on='Index')
+
+    if software_cycle_number:
+        data_df['Cycle'] = NewareNDA.NewareNDA._generate_cycle_number(data_df, cycle_mode)
+
+    return data_df.astype(dtype=dtype_dict, copy=False)
+
+
+@contextmanager
+def _ndc_buffer(file):
+    """
+    Yield a readable buffer of ndc data. file can either be the name of
+    an ndc file or a bytes-like object holding its contents.
+    """
+    if isinstance(file, (bytes, bytearray, memoryview)):
+        yield file
+    else:
+        with open(file, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            _madvise_sequential(mm)
+            yield mm
+
+
+def _madvise_sequential(mm):
+    """
+    Hint the kernel that the mmap will be read sequentially, enabling
+    aggressive readahead. madvise is not available on all platforms.
+    """
+    if hasattr(mmap, 'MADV_SEQUENTIAL'):
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    if hasattr(mmap, 'MADV_WILLNEED'):
+        mm.madvise(mmap.MADV_WILLNEED)
+
+
+def _ffill(values):
+    """Forward-fill NaN entries of a float array in a single numpy pass"""
+    idx = np.where(np.isnan(values), 0, np.arange(len(values)))
+    np.maximum.accumulate(idx, out=idx)
+    return values[idx]
+
+
+def _interpolate_inside(values, groups):
+    """
+    Linearly interpolate NaN runs that lie strictly between valid values
+    belonging to the same group. Equivalent to a groupby transform with
+    pd.Series.interpolate(limit_area='inside'), but runs as a few numpy
+    passes. groups must be sorted so each group is one contiguous block.
+    """
+    n = len(values)
+    pos = np.arange(n)
+    valid = ~np.isnan(values)
+    if valid.all() or not valid.any():
+        return values
+
+    # Nearest valid sample at/before and at/after each position
+    prev_valid = np.maximum.accumulate(np.where(valid, pos, -1))
+    next_valid = np.minimum.accumulate(np.where(valid, pos, n)[::-1])[::-1]
+
+    # First and last position of the group block containing each position
+    new_group = np.concatenate(([True], groups[1:] != groups[:-1]))
+    block_start = np.maximum.accumulate(np.where(new_group, pos, 0))
+    is_end = np.concatenate((new_group[1:], [True]))
+    block_end = np.minimum.accumulate(np.where(is_end, pos, n)[::-1])[::-1]
+
+    # 'inside' NaNs have valid neighbors within their own block, so a
+    # global interpolation over the valid samples fills them correctly
+    inside = ~valid & (prev_valid >= block_start) & (next_valid <= block_end)
+    values[inside] = np.interp(pos[inside], pos[valid], values[valid])
+    return values
+
+
+def _data_interpolation(df):
+    """
+    Some ndax from from BTS Server 8 do not seem to contain a complete dataset.
+    This helper function fills in missing times, capacities, and energies.
+    """
+    # Identify the valid data
+    nan_mask = df['Time'].notnull()
+
+    if nan_mask.any():
+        logging.warning("IMPORTANT: This ndax has missing data. The output "
+                        "from NewareNDA contains interpolated data!")
+
+    # Run 'inside' interpolation on Time within each step
+    df['Time'] = _interpolate_inside(df['Time'].to_numpy(dtype='float64'),
+                                     df['Step'].to_numpy())
+
+    # Perform extrapolation to generate the remaining missing Time
+    nan_mask2 = df['Time'].notnull()
+    time_inc = df['Time'].diff().ffill().groupby(nan_mask2.cumsum()).cumsum()
+    time = df['Time'].ffill() + time_inc.shift()
+    df['Time'] = df['Time'].where(nan_mask2, time)
+
+    # Fill in missing Timestamps
+    time_inc = df['Time'].diff().groupby(nan_mask.cumsum()).cumsum()
+    timestamp = df['Timestamp'].ffill() + \
+        pd.to_timedelta(time_inc.shift().fillna(0), unit='s')
+    df['Timestamp'] = df['Timestamp'].where(nan_mask, timestamp)
+
+    # Integrate to get capacity and fill missing values
+    capacity = df['Time'].diff()*abs(df['Current(mA)'])/3600
+    inc = capacity.groupby(nan_mask.cumsum()).cumsum()
+    chg = df['Charge_Capacity(mAh)'].ffill() + \
+        inc.where(df['Current(mA)'] > 0, 0).shift()
+    dch = df['Discharge_Capacity(mAh)'].ffill() + \
+        inc.where(df['Current(mA)'] < 0, 0).shift()
+    df['Charge_Capacity(mAh)'] = df['Charge_Capacity(mAh)'].where(nan_mask, chg)
+    df['Discharge_Capacity(mAh)'] = df['Discharge_Capacity(mAh)'].where(nan_mask, dch)
+
+    # Integrate to get energy and fill missing values
+    energy = capacity*df['Voltage']
+    inc = energy.groupby(nan_mask.cumsum()).cumsum()
+    chg = df['Charge_Energy(mWh)'].ffill() + \
+        inc.where(df['Current(mA)'] > 0, 0).shift()
+    dch = df['Discharge_Energy(mWh)'].ffill() + \
+        inc.where(df['Current(mA)'] < 0, 0).shift()
+    df['Charge_Energy(mWh)'] = df['Charge_Energy(mWh)'].where(nan_mask, chg)
+    df['Discharge_Energy(mWh)'] = df['Discharge_Energy(mWh)'].where(nan_mask, dch)
+
+
+def _read_data_ndc(file):
+    with _ndc_buffer(file) as mm:
+        mm_size = len(mm)
+
+        # Choose multipliers based on ndc file version
+        [ndc_version] = _struct_B.unpack_from(mm, 2)
+        multipliers = [1e-4, 1]
+        if ndc_version == 14:
+            multipliers = [1, 1000]
+
+        # Identify the beginning of the data section
+        record_len = 4096
+        header = 4096
+
+        # Parse all records in a single vectorized pass
+        n_rec = (mm_size - header) // record_len
+        payload = np.frombuffer(mm, dtype=np.uint8,
+                                count=n_rec*record_len,
+                                offset=header).reshape(-1, record_len)[:, 132:-4]
+        rec = np.ascontiguousarray(payload).view(
+            np.dtype([('Voltage', '<f4'), ('Current', '<f4')])).ravel()
+        rec = rec[rec['Voltage'] != 0]
+
+    # Create DataFrame
+    df = pd.DataFrame({
+        'Voltage': multipliers[0]*rec['Voltage'].astype('float64'),
+        'Current(mA)': multipliers[1]*rec['Current'].astype('float64')})
+    df['Index'] = df.index + 1
+    return df
+
+
+def _read_data_runInfo_ndc(file):
+    with _ndc_buffer(file) as mm:
+        mm_size = len(mm)
+
+        # Choose byte format based on ndc file version
+        [ndc_version] = _struct_B.unpack_from(mm, 2)
+        multipliers = [1e-3, 1/3600, 1/3600, 1/3600, 1/3600]
+        end_byte = -63
+        tail = 2
+        if ndc_version >= 14:
+            end_byte = -59
+            tail = 10
+            multipliers = [1e-3, 1000, 1000, 1000, 1000]
+        dtype = np.dtype([
+            ('Time', '<i4'), ('_s', 'S1'),
+            ('Charge_Capacity', '<f4'), ('Discharge_Capacity', '<f4'),
+            ('Charge_Energy', '<f4'), ('Discharge_Energy', '<f4'),
+            ('_pad', 'S12'),
+            ('Timestamp', '<i4'), ('Step', '<i4'), ('Index', '<i4'),
+            ('_tail', f'S{tail}')])
+
+        # Identify the beginning of the data section
+        record_len = 4096
+        header = 4096
+
+        # Parse all records in a single vectorized pass
+        n_rec = (mm_size - header) // record_len
+        payload = np.frombuffer(mm, dtype=np.uint8,
+                                count=n_rec*record_len,
+                                offset=header).reshape(-1, record_len)[:, 132:end_byte]
+        rec = np.ascontiguousarray(payload).view(dtype).ravel()
+        rec = rec[rec['Index'] != 0]
+
+    # Create DataFrame
+    df = pd.DataFrame({
+        'Time': multipliers[0]*rec['Time'].astype('float64'),
+        'Charge_Capacity(mAh)': multipliers[1]*rec['Charge_Capacity'].astype('float64'),
+        'Discharge_Capacity(mAh)': multipliers[2]*rec['Discharge_Capacity'].astype('float64'),
+        'Charge_Energy(mWh)': multipliers[3]*rec['Charge_Energy'].astype('float64'),
+        'Discharge_Energy(mWh)': multipliers[4]*rec['Discharge_Energy'].astype('float64'),
+        'Timestamp': pd.to_datetime(rec['Timestamp'], unit='s', utc=True)
+        .tz_convert(datetime.now(timezone.utc).astimezone().tzinfo),
+        'Step': rec['Step'],
+        'Index': rec['Index']})
+    df['Step'] = NewareNDA.NewareNDA._count_changes(df['Step'])
+
+    return df
+
+
+def _read_data_step_ndc(file):
+    with _ndc_buffer(file) as mm:
+        mm_size = len(mm)
+
+        # Identify the beginning of the data section
+        record_len = 4096
+        header = 4096
+
+        # Parse all records in a single vectorized pass
+        dtype = np.dtype([
+            ('Cycle', '<i4'), ('Step_Index', '<i4'),
+            ('_a', 'S16'), ('Status', 'i1'), ('_b', 'S12')])
+        n_rec = (mm_size - header) // record_len
+        payload = np.frombuffer(mm, dtype=np.uint8,
+                                count=n_rec*record_len,
+                                offset=header).reshape(-1, record_len)[:, 132:-5]
+        rec = np.ascontiguousarray(payload).view(dtype).ravel()
+        rec = rec[rec['Step_Index'] != 0]
+
+    # Create DataFrame
+    df = pd.DataFrame({
+        'Cycle': (rec['Cycle'] + 1).astype('uint16'),
+        'Step_Index': rec['Step_Index'],
+        'Status': NewareNDA.NewareNDA._state_categorical(rec['Status'])})
+    df['Step'] = df.index + 1
+    return df
+
+
+def read_ndc(file):
+    """
+    Function to read electrochemical data from a Neware ndc binary file.
+
+    Args:
+        file (str or bytes): Name of an .ndc file to read, or a
+            bytes-like object holding its contents
+    Returns:
+        df (pd.DataFrame): DataFrame containing all records in the file
+        aux_df (pd.DataFrame): DataFrame containing any temperature data
+    """
+    with _ndc_buffer(file) as mm:
+
+        # Get ndc file version
+        [ndc_version] = _struct_B.unpack_from(mm, 2)
+        logging.info(f"NDC version: {ndc_version}")
+
+        if ndc_version == 2:
+            return _read_ndc_2(mm)
+        if ndc_version == 5:
+            return _read_ndc_5(mm)
+        elif ndc_version == 11:
+            return _read_ndc_11(mm)
+        else:
+            raise NotImplementedError(f"ndc version {ndc_version} is not yet supported!")
+
+
+def _read_ndc_2(mm):
+    """Helper function that reads records and aux data from ndc version 2"""
+    record_len = 94
+    identifier = mm[517:525]
+    id_byte = slice(0, 1)
+
+    # Records are fixed-length, so all offsets can be computed up front
+    # instead of scanning for each record with mm.find
+    arr = np.frombuffer(mm, dtype=np.uint8)
+    header = mm.find(identifier)
+    n_rec = (len(arr) - header) // record_len
+    recs = arr[header:header + n_rec*record_len].reshape(-1, record_len)
+    tags = recs[:, 0]
+
+    # Warn about any unrecognized record types
+    for tag in np.unique(tags[~np.isin(tags, (0x55, 0x65, 0x74))]):
+        logging.warning("Unknown record type: " + bytes([tag]).hex())
+
+    # Create DataFrame and sort by Index
+    df = _ndc_records_to_df(recs[tags == 0x55])
+
+    # Postprocessing
+    aux_df = pd.DataFrame([])
+    df = df.astype(dtype=dtype_dict, copy=False)
+    if identifier[id_byte] == b'\x65':
+        aux_df = _aux_65_records_to_df(recs[tags == 0x65])
+    elif identifier[id_byte] == b'\x74':
+        aux_df = _aux_74_records_to_df(recs[tags == 0x74])
+
+    return df, aux_df
+
+
+def _read_ndc_5(mm):
+    """Helper function that reads records and aux data from ndc version 5"""
+    mm_size = len(mm)
+    record_len = 4096
+    header = 4096
+    rec_len = 87
+    rec_byte = 7
+
+    # Gather the 87-byte records from every chunk and classify them by tag
+    n_chunk = (mm_size - header) // record_len
+    payload = np.frombuffer(mm, dtype=np.uint8,
+                            count=n_chunk*record_len,
+                            offset=header).reshape(-1, record_len)[:, 125:-56]
+    recs = np.ascontiguousarray(payload).reshape(-1, rec_len)
+    tags = recs[:, rec_byte]
+
+    # Create DataFrames
+    df = _ndc_records_to_df(recs[tags == 0x55])
+
+    # Concat aux65 and aux74 if they both contain data
+    aux_df = _aux_65_records_to_df(recs[tags == 0x65])
+    aux74_df = _aux_74_records_to_df(recs[tags == 0x74])
+    if (not aux_df.empty) & (not aux74_df.empty):
+        aux_df = pd.concat([aux_df, aux74_df.drop(columns=['t'])])
+    elif (not aux74_df.empty):
+        aux_df = aux74_df
+
+    return df, aux_df
+
+
+def _read_ndc_11(mm):
+    """Helper function that reads aux data from ndc version 11"""
+    mm_size = len(mm)
+    record_len = 4096
+    header = 4096
+
+    # Parse all records in a single vectorized pass
+    dtype = np.dtype([('tag', 'u1'), ('V', '<f4'), ('T', '<i2')])
+    n_chunk = (mm_size - header) // record_len
+    payload = np.frombuffer(mm, dtype=np.uint8,
+                            count=n_chunk*record_len,
+                            offset=header).reshape(-1, record_len)[:, 132:-2]
+    rec = np.ascontiguousarray(payload).view(dtype).ravel()
+    rec = rec[rec['tag'] == 0x65]
+
+    # Create DataFrame
+    aux_df = pd.DataFrame({
+        'V': rec['V'].astype('float64')*1e-4,
+        'T': rec['T']*0.1})
+    aux_df['Index'] = aux_df.index + 1
+    return None, aux_df
+
+
+# Field layout of an ndc data record, shared by ndc versions 2 and 5
+_ndc_rec_dtype = np.dtype({
+    'names': [
+        'Index', 'Cycle', 'Step', 'Status', 'Time', 'Voltage', 'Current',
+        'Charge_Capacity', 'Discharge_Capacity',
+        'Charge_Energy', 'Discharge_Energy',
+        'Y', 'M', 'D', 'h', 'm', 's', 'Range'],
+    'formats': [
+        '<u4', '<u4', 'u1', 'u1', '<u8', '<i4', '<i4',
+        '<i8', '<i8', '<i8', '<i8',
+        '<u2', 'u1', 'u1', 'u1', 'u1', 'u1', '<i4'],
+    'offsets': [8, 12, 16, 17, 23, 31, 35, 43, 51, 59, 67,
+                75, 77, 78, 79, 80, 81, 82],
+    'itemsize': 86})
+
+
+def _ndc_records_to_df(recs):
+    """
+    Helper function that converts a block of ndc data records into a
+    DataFrame. recs is a 2D uint8 array with one record per row.
+    """
+    rec = np.ascontiguousarray(
+        recs[:, :_ndc_rec_dtype.itemsize]).view(_ndc_rec_dtype).ravel()
+
+    # Look up the current multiplier for each record
+    ranges, inverse = np.unique(rec['Range'], return_inverse=True)
+    multiplier = np.array([multiplier_dict[r] for r in ranges])[inverse]
+
+    # Fold the 1/3600 capacity scaling into the multiplier so each column
+    # needs only a single multiply
+    cap_multiplier = multiplier*(1/3600)
+
+    df = pd.DataFrame({
+        'Index': rec['Index'],
+        'Cycle': (rec['Cycle'] + 1).astype('uint16'),
+        'Step': rec['Step'],
+        'Status': NewareNDA.NewareNDA._state_categorical(rec['Status']),
+        'Time': (rec['Time']*1e-3).astype('float32'),
+        'Voltage': (rec['Voltage']*1e-4).astype('float32'),
+        'Current(mA)': (rec['Current']*multiplier).astype('float32'),
+        'Charge_Capacity(mAh)': (rec['Charge_Capacity']*cap_multiplier).astype('float32'),
+        'Discharge_Capacity(mAh)': (rec['Discharge_Capacity']*cap_multiplier).astype('float32'),
+        'Charge_Energy(mWh)': (rec['Charge_Energy']*cap_multiplier).astype('float32'),
+        'Discharge_Energy(mWh)': (rec['Discharge_Energy']*cap_multiplier).astype('float32'),
+        'Timestamp': pd.to_datetime(dict(
+            year=rec['Y'], month=rec['M'], day=rec['D'],
+            hour=rec['h'], minute=rec['m'], second=rec['s']))})
+    return df
+
+
+def _bytes_to_list_ndc(bytes):
+    """Scalar fallback for _ndc_records_to_df that interprets a single
+    ndc byte string"""
+
+    # Extract fields from byte string
+    [Index, Cycle] = _struct_II.unpack_from(bytes, 8)
+    [Step] = _struct_B.unpack_from(bytes, 16)
+    [Status] = _struct_B.unpack_from(bytes, 17)
+    [Time] = _struct_Q.unpack_from(bytes, 23)
+    [Voltage, Current] = _struct_ii.unpack_from(bytes, 31)
+    [Charge_capacity, Discharge_capacity] = _struct_qq.unpack_from(bytes, 43)
+    [Charge_energy, Discharge_energy] = _struct_qq.unpack_from(bytes, 59)
+    [Y, M, D, h, m, s] = _struct_date.unpack_from(bytes, 75)
+    [Range] = _struct_i.unpack_from(bytes, 82)
+
+    multiplier = multiplier_dict[Range]
+
+    # Create a record
+    list = [
+        Index,
+        Cycle + 1,
+        Step,
+        state_dict[Status],
+        Time/1000,
+        Voltage/10000,
+        Current*multiplier,
+        Charge_capacity*multiplier/3600,
+        Discharge_capacity*multiplier/3600,
+        Charge_energy*multiplier/3600,
+        Discharge_energy*multiplier/3600,
+        datetime(Y, M, D, h, m, s)
+    ]
+    return list
+
+
+# Field layouts of the 0x65 and 0x74 ndc auxiliary records
+_aux_65_dtype = np.dtype({
+    'names': ['Aux', 'Index', 'V', 'T'],
+    'formats': ['u1', '<u4', '<i4', '<i2'],
+    'offsets': [3, 8, 31, 41],
+    'itemsize': 43})
+_aux_74_dtype = np.dtype({
+    'names': ['Aux', 'Index', 'V', 'T', 't'],
+    'formats': ['u1', '<u4', '<i4', '<i2', '<i2'],
+    'offsets': [3, 8, 31, 41, 43],
+    'itemsize': 45})
+
+
+def _aux_65_records_to_df(recs):
+    """Helper function that converts a block of 0x65 aux records into a
+    DataFrame. recs is a 2D uint8 array with one record per row."""
+    rec = np.ascontiguousarray(
+        recs[:, :_aux_65_dtype.itemsize]).view(_aux_65_dtype).ravel()
+    return pd.DataFrame({
+        'Index': rec['Index'],
+        'Aux': rec['Aux'],
+        'V': rec['V']*1e-4,
+        'T': rec['T']*0.1})
+
+
+def _aux_74_records_to_df(recs):
+    """Helper function that converts a block of 0x74 aux records into a
+    DataFrame. recs is a 2D uint8 array with one record per row."""
+    rec = np.ascontiguousarray(
+        recs[:, :_aux_74_dtype.itemsize]).view(_aux_74_dtype).ravel()
+    return pd.DataFrame({
+        'Index': rec['Index'],
+        'Aux': rec['Aux'],
+        'V': rec['V']*1e-4,
+        'T': rec['T']*0.1,
+        't': rec['t']*0.1})
+
+
+def _aux_bytes_65_to_list_ndc(bytes):
+    """Scalar fallback for _aux_65_records_to_df"""
+    [Aux] = _struct_B.unpack_from(bytes, 3)
+    [Index] = _struct_I.unpack_from(bytes, 8)
+    [T] = _struct_h.unpack_from(bytes, 41)
+    [V] = _struct_i.unpack_from(bytes, 31)
+
+    return [Index, Aux, V/10000, T/10]
+
+
+def _aux_bytes_74_to_list_ndc(bytes):
+    """Scalar fallback for _aux_74_records_to_df"""
+    [Aux] = _struct_B.unpack_from(bytes, 3)
+    [Index] = _struct_I.unpack_from(bytes, 8)
+    [V] = _struct_i.unpack_from(bytes, 31)
+    [T, t] = _struct_hh.unpack_from(bytes, 41)
+
+    return [Index, Aux, V/10000, T/10, t/10]